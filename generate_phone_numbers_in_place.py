@@ -0,0 +1,61 @@
+import logging
+import os
+from time import perf_counter
+
+import numpy as np
+
+from utils import RECORD_LENGTH, format_phone_number_range, fy_shuffle, log_progress
+
+"""
+This script generates the same file as generate_random_phone_numbers.py, but without temp files.
+
+Every phone number takes exactly RECORD_LENGTH bytes, so the final file can be allocated right
+away. The script memory-maps it, writes all numbers in ascending order and then shuffles the
+records in place. It is up to OS which pages of the file to keep in RAM, so the whole file
+doesn't have to fit into memory, but random access to it is slow on HDD.
+"""
+
+START_NUMBER = int(os.environ.get("START_NUMBER", 79000000000))
+STOP_NUMBER = int(os.environ.get("STOP_NUMBER", 80000000000))
+
+# how many numbers are formatted at once
+BLOCK_SIZE = int(os.environ.get("BLOCK_SIZE", 2 ** 20))
+FINAL_FILE_NAME = os.environ.get("FINAL_FILE_NAME", "phone_numbers_shuffled.txt")
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s: %(message)s', datefmt='%H:%M:%S')
+logger = logging.getLogger(__name__)
+
+
+def write_numbers_in_order(records: np.ndarray, start_number: int, block_size: int) -> None:
+    """Fills records with phone numbers in ascending order starting from start_number."""
+    start_time = perf_counter()
+    for offset in range(0, len(records), block_size):
+        block = records[offset:offset + block_size]
+        format_phone_number_range(start_number + offset, start_number + offset + len(block), out=block)
+        log_progress(logger, offset + len(block), len(records), start_time)
+
+
+def main():
+    """Controls main flow."""
+    start_time = perf_counter()
+
+    # np.memmap creates the file of the required size and maps it into memory
+    records = np.memmap(FINAL_FILE_NAME, dtype=np.uint8, mode="w+",
+                        shape=(STOP_NUMBER - START_NUMBER, RECORD_LENGTH))
+
+    logger.info(f"Writing {len(records)} numbers to {FINAL_FILE_NAME}...")
+    write_numbers_in_order(records, START_NUMBER, BLOCK_SIZE)
+    logger.info(f"Time taken to write numbers: {perf_counter() - start_time}")
+
+    logger.info("Shuffling numbers in place...")
+    fy_shuffle(records)
+
+    records.flush()
+    del records
+
+    resulted_time = perf_counter() - start_time
+    logger.info(f"Time taken for the whole script to run: {resulted_time} seconds")
+
+
+if __name__ == '__main__':
+    main()
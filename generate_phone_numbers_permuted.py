@@ -0,0 +1,99 @@
+import logging
+import os
+import typing as tp
+from time import perf_counter
+
+import numpy as np
+
+from utils import chunked_arange, format_phone_numbers, log_progress
+
+"""
+This script generates the same file as generate_random_phone_numbers.py in one sequential pass.
+
+Instead of shuffling numbers it computes a pseudorandom permutation of the range: the i-th
+line of the file is START_NUMBER + permute(i), where permute is a keyed Feistel network.
+A Feistel network is a bijection on numbers of a fixed bit width; values which fall outside
+of the range are fed to it again ("cycle walking") until they land inside. So there are no temp
+files, memory consumption doesn't depend on the range size, and the disk is only written to
+sequentially.
+
+Set SEED to get the same order of numbers on every run.
+"""
+
+START_NUMBER = int(os.environ.get("START_NUMBER", 79000000000))
+STOP_NUMBER = int(os.environ.get("STOP_NUMBER", 80000000000))
+
+# how many numbers are permuted and formatted at once
+BLOCK_SIZE = int(os.environ.get("BLOCK_SIZE", 2 ** 20))
+WRITE_BUFFER_SIZE = int(os.environ.get("WRITE_BUFFER_SIZE", 8 * 1024 * 1024))
+FINAL_FILE_NAME = os.environ.get("FINAL_FILE_NAME", "phone_numbers_shuffled.txt")
+
+SEED = os.environ.get("SEED")
+FEISTEL_ROUNDS = 6
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s: %(message)s', datefmt='%H:%M:%S')
+logger = logging.getLogger(__name__)
+
+
+class FeistelPermutation:
+    """A keyed pseudorandom permutation of integers in [0, size)."""
+
+    def __init__(self, size: int, seed: tp.Optional[int] = None, rounds: int = FEISTEL_ROUNDS) -> None:
+        self.size = size
+        # both halves must be equally wide, so the network works on an even number of bits
+        self.half_bits = np.uint64(max(1, ((size - 1).bit_length() + 1) // 2))
+        self.half_mask = np.uint64((1 << int(self.half_bits)) - 1)
+        self.round_keys = np.random.SeedSequence(seed).generate_state(rounds, dtype=np.uint64)
+
+    def _round_function(self, half: np.ndarray, key: np.uint64) -> np.ndarray:
+        # splitmix64 finalizer, a cheap mixer which spreads every input bit over the output
+        z = half ^ key
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return (z ^ (z >> np.uint64(31))) & self.half_mask
+
+    def _encrypt(self, values: np.ndarray) -> np.ndarray:
+        left, right = values >> self.half_bits, values & self.half_mask
+        for key in self.round_keys:
+            left, right = right, left ^ self._round_function(right, key)
+        return (left << self.half_bits) | right
+
+    def __call__(self, indexes: np.ndarray) -> np.ndarray:
+        """Returns permuted values of the given indexes."""
+        values = self._encrypt(indexes.astype(np.uint64))
+        outside = values >= self.size
+        while outside.any():
+            values[outside] = self._encrypt(values[outside])
+            outside = values >= self.size
+        return values.astype(np.int64)
+
+
+def write_permuted_numbers(start_number: int,
+                           stop_number: int,
+                           final_file_name: str,
+                           permutation: FeistelPermutation,
+                           block_size: int = BLOCK_SIZE) -> None:
+    """Writes all numbers of the range to the file in the order given by the permutation."""
+    start_time = perf_counter()
+    total = stop_number - start_number
+
+    with open(final_file_name, "wb", buffering=WRITE_BUFFER_SIZE) as final_file:
+        for indexes in chunked_arange(0, total, block_size):
+            final_file.write(format_phone_numbers(start_number + permutation(indexes)).data)
+            log_progress(logger, int(indexes[-1]) + 1, total, start_time)
+
+
+def main():
+    """Controls main flow."""
+    start_time = perf_counter()
+
+    permutation = FeistelPermutation(STOP_NUMBER - START_NUMBER,
+                                     seed=int(SEED) if SEED is not None else None)
+    write_permuted_numbers(START_NUMBER, STOP_NUMBER, FINAL_FILE_NAME, permutation)
+
+    resulted_time = perf_counter() - start_time
+    logger.info(f"Time taken for the whole script to run: {resulted_time} seconds")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,27 +2,40 @@ import logging
 import os
 import typing as tp
 from datetime import datetime
-from random import shuffle, random
+from multiprocessing import Pool
 from time import perf_counter
 
+import numpy as np
+
+from utils import (RECORD_LENGTH, chunked_arange, format_phone_numbers, fy_shuffle, log_progress,
+                   release_memory, write_all)
+
 """
 This script if for generating a file with a list of all numbers between +79000000000 and 
 +79999999999 in a random order.
 
 It optimized to be suitable for machines with ~12-16 Gb or RAM, that's why we don't create 
-the whole list of numbers in the script right away. Instead, we create 10 files, distribute
+the whole list of numbers in the script right away. Instead, we create 16 files, distribute
 numbers between them, than shuffle every file and merge them into one final file.
 
-Because of this split&merge strategy the script is not that fast.
+Temp files keep numbers as raw 8-byte integers, they are turned into text lines only when
+written to the final file. So a chunk takes ~0.5 Gb of RAM for 1/16 of all numbers. Chunks are
+shuffled by SHUFFLE_PROCESSES processes at once, so it takes about
+SHUFFLE_PROCESSES * 8 Gb / NUMBER_OF_CHUNKS of RAM.
 """
 
 START_NUMBER = int(os.environ.get("START_NUMBER", 79000000000))
 STOP_NUMBER = int(os.environ.get("STOP_NUMBER", 80000000000))
 
-NUMBER_OF_CHUNKS = int(os.environ.get("NUMBER_OF_CHUNKS", 20))
+NUMBER_OF_CHUNKS = int(os.environ.get("NUMBER_OF_CHUNKS", 16))
+# how many numbers are distributed between files or formatted at once
+BLOCK_SIZE = int(os.environ.get("BLOCK_SIZE", 2 ** 20))
+# temp files get a big buffer, so the kernel sees a few large writes instead of many small ones
+WRITE_BUFFER_SIZE = int(os.environ.get("WRITE_BUFFER_SIZE", 8 * 1024 * 1024))
+SHUFFLE_PROCESSES = int(os.environ.get("SHUFFLE_PROCESSES", min(4, os.cpu_count() or 1)))
 FINAL_FILE_NAME = os.environ.get("FINAL_FILE_NAME", "phone_numbers_shuffled.txt")
 
-RAW_FILE_NAMES = tuple(f"file_{i}.txt" for i in range(1, NUMBER_OF_CHUNKS+1))
+RAW_FILE_NAMES = tuple(f"file_{i}.u64" for i in range(1, NUMBER_OF_CHUNKS+1))
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s: %(message)s', datefmt='%H:%M:%S')
 logger = logging.getLogger(__name__)
@@ -31,39 +44,82 @@ logger = logging.getLogger(__name__)
 def generate_temp_files_with_numbers(start_number: int,
                                      stop_number: int,
                                      number_of_chunks: int,
-                                     raw_files_name: tp.Tuple[str]) -> None:
-    """Generates several files with phone numbers."""
+                                     raw_files_name: tp.Tuple[str],
+                                     block_size: int = BLOCK_SIZE,
+                                     write_buffer_size: int = WRITE_BUFFER_SIZE) -> None:
+    """Generates several binary files with phone numbers stored as int64."""
 
-    files = [open(f"{raw_file_name}", "w") for raw_file_name in raw_files_name]
+    files = [open(raw_file_name, "wb", buffering=write_buffer_size) for raw_file_name in raw_files_name]
 
     start_time = perf_counter()
+    rng = np.random.default_rng()
+    numbers_written = 0
 
     logger.info(f"Start generating phone numbers at {datetime.now().strftime('%H:%M:%S')}")
-    for i, number in enumerate(range(start_number, stop_number), start=0):
-        if i % 10000000 == 0:
-            logger.info(f"There are {i} numbers has been written so far...")
-            logger.info(f"Time since start: {perf_counter() - start_time} seconds")
-
-        file_number = int(random() * number_of_chunks)
-        files[file_number].write(f"+{number}\n")
+    for numbers in chunked_arange(start_number, stop_number, block_size):
+        # group numbers by their file, so every file gets one contiguous slice of the block
+        file_numbers = rng.integers(0, number_of_chunks, len(numbers), dtype=np.uint16)
+        numbers = numbers[np.argsort(file_numbers, kind="stable")]
+        counts = np.bincount(file_numbers, minlength=number_of_chunks)
+        offsets = np.concatenate(([0], counts.cumsum()))
+        for file_number, file in enumerate(files):
+            file.write(numbers[offsets[file_number]:offsets[file_number + 1]].data)
+
+        numbers_written += len(numbers)
+        log_progress(logger, numbers_written, stop_number - start_number, start_time)
 
     [file.close() for file in files]
 
-    logger.info(f"Time taken to write 10 files with random numbers: {perf_counter() - start_time}")
+    logger.info(f"Time taken to write {number_of_chunks} files with random numbers: {perf_counter() - start_time}")
+
+
+def shuffle_chunk(file_name: str,
+                  final_file_name: str,
+                  offset: int,
+                  block_size: int = BLOCK_SIZE) -> str:
+    """Shuffles one chunk with numbers and writes it to its place in the resulting file."""
+    numbers = np.fromfile(file_name, dtype=np.int64)
+    # every number is 8 bytes, shuffle them as 8-byte rows
+    fy_shuffle(numbers.view(np.uint8).reshape(-1, numbers.itemsize))
+
+    fd = os.open(final_file_name, os.O_WRONLY)
+    try:
+        # format block by block, so text lines of the whole chunk are never in memory at once
+        for block_start in range(0, len(numbers), block_size):
+            records = format_phone_numbers(numbers[block_start:block_start + block_size])
+            write_all(fd, records.data, offset + block_start * RECORD_LENGTH)
+    finally:
+        os.close(fd)
+
+    del numbers
+    release_memory()
+    return file_name
+
+
+def _shuffle_chunk_task(task: tp.Tuple[str, str, int]) -> str:
+    """Unpacks arguments of shuffle_chunk, Pool.imap_unordered passes a single one."""
+    return shuffle_chunk(*task)
 
 
-def shuffle_and_merge(file_names: tp.Tuple[str], final_file_name: str) -> None:
-    """Opens a chunk with numbers, shuffles, writes them out to the resulting file."""
+def shuffle_and_merge(file_names: tp.Tuple[str],
+                      final_file_name: str,
+                      processes: int = SHUFFLE_PROCESSES) -> None:
+    """Shuffles chunks with numbers in parallel, writes them out to the resulting file."""
     start_writing_time = perf_counter()
     logger.info("Opening final file...")
 
-    with open(final_file_name, "w") as final_file:
-        for file_name in file_names:
-            with open(file_name, 'r') as raw_file:
-                logger.info(f"Shuffling {file_name}...")
-                lines = raw_file.readlines()
-                shuffle(lines)
-                final_file.writelines(lines)
+    # every chunk goes right after the previous one, so its place is known in advance
+    sizes = [os.path.getsize(file_name) // np.dtype(np.int64).itemsize * RECORD_LENGTH
+             for file_name in file_names]
+    offsets = [sum(sizes[:i]) for i in range(len(sizes))]
+    with open(final_file_name, "wb") as final_file:
+        final_file.truncate(sum(sizes))
+
+    logger.info(f"Shuffling chunks in {processes} processes...")
+    with Pool(processes=processes) as pool:
+        tasks = [(file_name, final_file_name, offset) for file_name, offset in zip(file_names, offsets)]
+        for file_name in pool.imap_unordered(_shuffle_chunk_task, tasks):
+            logger.info(f"{file_name} has been shuffled")
 
     [os.remove(file) for file in file_names]
     logger.info(f"Time taken to shuffle and merge lines: {perf_counter() - start_writing_time}")
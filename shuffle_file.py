@@ -0,0 +1,66 @@
+import logging
+import os
+from time import perf_counter
+
+import numpy as np
+
+from utils import detect_record_length, fy_shuffle, is_one_line_per_row
+
+"""
+This script shuffles lines of any file, for example to shuffle sorted phone numbers back.
+
+The whole file is read into memory. If all lines have the same length, like phone numbers
+written by the other scripts do, the file is kept as a matrix of bytes with one line per row
+and shuffled by compiled code, which takes as much RAM as the file takes on disk. Otherwise
+lines are read into a list of Python strings, which takes several times more.
+"""
+
+FILE_NAME_TO_SHUFFLE = os.environ.get("FILE_TO_SHUFFLE", "sorted_phone_numbers.txt")
+RESULTING_FILE_NAME = os.environ.get("RESULTING_FILE_NAME", "shuffled_lines.txt")
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s: %(message)s', datefmt='%H:%M:%S')
+logger = logging.getLogger(__name__)
+
+
+def shuffle_fixed_width(file_name: str, resulting_file_name: str, record_length: int) -> bool:
+    """Shuffles a file of equally long lines, returns False if the lines turn out to differ."""
+    records = np.fromfile(file_name, dtype=np.uint8).reshape(-1, record_length)
+    if not is_one_line_per_row(records):
+        return False
+
+    fy_shuffle(records)
+    records.tofile(resulting_file_name)
+    return True
+
+
+def shuffle_lines(file_name: str, resulting_file_name: str) -> None:
+    """Shuffles lines of any length."""
+    with open(file_name, "r") as file:
+        lines = file.readlines()
+    # otherwise the last line would be glued to whichever line lands after it
+    if lines and not lines[-1].endswith("\n"):
+        lines[-1] += "\n"
+
+    # PCG64 draws are much cheaper than Mersenne Twister ones random.shuffle makes
+    np.random.default_rng().shuffle(lines)
+    with open(resulting_file_name, "w") as resulting_file:
+        resulting_file.writelines(lines)
+
+
+def main():
+    """Controls main flow."""
+    start_time = perf_counter()
+    logger.info(f"Shuffling lines of {FILE_NAME_TO_SHUFFLE}...")
+
+    record_length = detect_record_length(FILE_NAME_TO_SHUFFLE)
+    if record_length and shuffle_fixed_width(FILE_NAME_TO_SHUFFLE, RESULTING_FILE_NAME, record_length):
+        logger.info(f"All lines are {record_length} bytes long, shuffled them as fixed-width records")
+    else:
+        shuffle_lines(FILE_NAME_TO_SHUFFLE, RESULTING_FILE_NAME)
+
+    resulted_time = perf_counter() - start_time
+    logger.info(f"Time taken for the whole script to run: {resulted_time} seconds")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,18 @@
+import io
 import logging
+import mmap
 import os
 import typing as tp
 from heapq import merge
 from time import perf_counter
 
-from utils import chunked
+import numpy as np
+from numba import njit
+from numba.typed import List
+
+from utils import (RECORD_LENGTH, advise_sequential, chunked, copy_file, detect_record_length,
+                   drop_from_cache, format_phone_number_range, is_one_line_per_row, log_progress,
+                   release_memory, write_all)
 
 """
 This script sorts a file with random phone numbers or any other lines.
@@ -16,6 +24,10 @@ stored on a disk. Then all chunks are merged into one resulting file.
 
 You can choose size of chunks (to be precise, how many lines should be in one chunk) on your
 own risk by providing environmental variable LINES_PER_CHUNK.
+
+If the file turns out to contain every number from START_NUMBER to STOP_NUMBER exactly once,
+which is what generate_random_phone_numbers.py produces, nothing is sorted at all: the sorted
+file is just written from scratch.
 """
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s: %(message)s', datefmt='%H:%M:%S')
@@ -32,9 +44,204 @@ LINES_PER_CHUNK = int(os.environ.get("LINES_PER_CHUNK", MILLION * 100))
 
 CHUNK_NAME_TEMPLATE = os.environ.get("CHUNK_NAME_TEMPLATE", "chunk_{0}.txt")
 
+# the range generate_random_phone_numbers.py writes by default
+START_NUMBER = int(os.environ.get("START_NUMBER", 79000000000))
+STOP_NUMBER = int(os.environ.get("STOP_NUMBER", 80000000000))
+
+# how many numbers are formatted or checked at once
+BLOCK_SIZE = int(os.environ.get("BLOCK_SIZE", MILLION))
+WRITE_BUFFER_SIZE = int(os.environ.get("WRITE_BUFFER_SIZE", 16 * 1024 * 1024))
+
+# size of the buffer the merged records are collected in before writing them out
+MERGE_BUFFER_SIZE = int(os.environ.get("MERGE_BUFFER_SIZE", 8 * 1024 * 1024))
+
+
+def read_fixed_width(file_name: str, record_length: int) -> np.ndarray:
+    """Maps a file of equally long lines into memory as a matrix with one line per row."""
+    return np.asarray(np.memmap(file_name, dtype=np.uint8, mode="r").reshape(-1, record_length))
+
+
+def is_fixed_width(file_name: str, record_length: int) -> bool:
+    """Checks that every line in the file is exactly record_length bytes long."""
+    if os.path.getsize(file_name) % record_length:
+        return False
+    if not os.path.getsize(file_name):
+        return True
+    return is_one_line_per_row(read_fixed_width(file_name, record_length))
+
+
+def keys_file_name(chunk_file_name: str) -> str:
+    """Returns the name of the file with numeric keys of a chunk of phone numbers."""
+    return f"{chunk_file_name}.keys"
+
+
+@njit(cache=True)
+def _less(chunks: List, keys: List, positions: np.ndarray, a: int, b: int, by_keys: bool) -> bool:
+    """Compares current records of two chunks, an exhausted chunk is bigger than anything.
+
+    Records are compared by their integer keys if by_keys is set, otherwise byte by byte.
+    """
+    if positions[a] == len(chunks[a]):
+        return False
+    if positions[b] == len(chunks[b]):
+        return True
+
+    if by_keys:
+        key_a = keys[a][positions[a]]
+        key_b = keys[b][positions[b]]
+        if key_a != key_b:
+            return key_a < key_b
+    else:
+        record_a = chunks[a][positions[a]]
+        record_b = chunks[b][positions[b]]
+        for column in range(len(record_a)):
+            if record_a[column] != record_b[column]:
+                return record_a[column] < record_b[column]
+    # keep records from earlier chunks first, as heapq.merge does
+    return a < b
+
+
+@njit(cache=True)
+def _build_loser_tree(chunks: List, keys: List, positions: np.ndarray, by_keys: bool) -> np.ndarray:
+    """Returns a loser tree: tree[0] is the winning chunk, other nodes keep losers of matches."""
+    number_of_chunks = len(chunks)
+    tree = np.empty(number_of_chunks, dtype=np.intp)
+    winners = np.empty(2 * number_of_chunks, dtype=np.intp)
+    for leaf in range(number_of_chunks):
+        winners[number_of_chunks + leaf] = leaf
+
+    for node in range(number_of_chunks - 1, 0, -1):
+        left, right = winners[2 * node], winners[2 * node + 1]
+        if _less(chunks, keys, positions, left, right, by_keys):
+            winners[node], tree[node] = left, right
+        else:
+            winners[node], tree[node] = right, left
+
+    tree[0] = winners[1]
+    return tree
+
+
+@njit(cache=True)
+def _merge_into(chunks: List,
+                keys: List,
+                positions: np.ndarray,
+                tree: np.ndarray,
+                out: np.ndarray,
+                by_keys: bool) -> int:
+    """Moves the smallest records of chunks into out, returns how many records were moved."""
+    number_of_chunks = len(chunks)
+    for count in range(len(out)):
+        winner = tree[0]
+        if positions[winner] == len(chunks[winner]):
+            return count
+
+        out[count] = chunks[winner][positions[winner]]
+        positions[winner] += 1
+
+        # replay the matches on the way from the winner's leaf to the root
+        node = (winner + number_of_chunks) // 2
+        while node >= 1:
+            if _less(chunks, keys, positions, tree[node], winner, by_keys):
+                tree[node], winner = winner, tree[node]
+            node //= 2
+        tree[0] = winner
+
+    return len(out)
+
+
+def merge_fixed_width(chunk_file_names: tp.List[str],
+                      resulting_file_name: str,
+                      record_length: int,
+                      by_keys: bool = False,
+                      buffer_size: int = MERGE_BUFFER_SIZE) -> None:
+    """Merges sorted files of equally long lines with a compiled loser tree.
+
+    If by_keys is set, every file has a file of keys next to it and keys are compared instead
+    of whole lines.
+    """
+    chunk_file_names = [name for name in chunk_file_names if os.path.getsize(name)]
+    chunks = List(read_fixed_width(name, record_length) for name in chunk_file_names)
+
+    if by_keys:
+        keys = List(np.asarray(np.memmap(keys_file_name(name), dtype=np.uint64, mode="r"))
+                    for name in chunk_file_names)
+    else:
+        # lines are compared as they are, keys are only there to keep types the same
+        keys = List(np.empty(0, dtype=np.uint64) for _ in chunk_file_names)
+
+    out = np.empty((max(buffer_size // record_length, 1), record_length), dtype=np.uint8)
+    fd = os.open(resulting_file_name, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        if chunks:
+            positions = np.zeros(len(chunks), dtype=np.intp)
+            tree = _build_loser_tree(chunks, keys, positions, by_keys)
+            while True:
+                count = _merge_into(chunks, keys, positions, tree, out, by_keys)
+                write_all(fd, out[:count].data)
+                if count < len(out):
+                    break
+    finally:
+        os.close(fd)
+
+
+def is_permutation_of_range(file_name: str,
+                            start_number: int,
+                            stop_number: int,
+                            block_size: int = BLOCK_SIZE) -> bool:
+    """Checks that the file has every phone number of the range exactly once, in any order."""
+    if os.path.getsize(file_name) != (stop_number - start_number) * RECORD_LENGTH:
+        return False
 
-def merge_files(chunk_file_names: tp.List[str], resulting_file_name: str) -> None:
-    """Merge sorted files into one sorted file."""
+    # as the file has as many lines as the range has numbers, it's enough to see them all
+    seen = np.zeros(stop_number - start_number, dtype=bool)
+    with open(file_name, "rb") as file:
+        advise_sequential(file.fileno())
+        for data in iter(lambda: file.read(block_size * RECORD_LENGTH), b""):
+            keys = phone_number_keys(np.frombuffer(data, dtype=np.uint8).reshape(-1, RECORD_LENGTH))
+            if keys is None:
+                return False
+
+            indexes = keys.astype(np.int64) - start_number
+            if np.any(indexes < 0) or np.any(indexes >= len(seen)):
+                return False
+            seen[indexes] = True
+
+    return bool(seen.all())
+
+
+def produce_sorted_file(file_name: str,
+                        start_number: int,
+                        stop_number: int,
+                        block_size: int = BLOCK_SIZE) -> None:
+    """Writes all phone numbers of the range to the file in ascending order."""
+    start_time = perf_counter()
+    with open(file_name, "wb", buffering=WRITE_BUFFER_SIZE) as file:
+        for block_start in range(start_number, stop_number, block_size):
+            block_stop = min(block_start + block_size, stop_number)
+            file.write(format_phone_number_range(block_start, block_stop).data)
+            log_progress(logger, block_stop - start_number, stop_number - start_number, start_time)
+
+
+def merge_files(chunk_file_names: tp.List[str],
+                resulting_file_name: str,
+                record_length: tp.Optional[int] = None,
+                keyed_chunk_file_names: tp.Collection[str] = ()) -> None:
+    """Merge sorted files into one sorted file.
+
+    keyed_chunk_file_names are the chunks this run saved keys for, see sort_phone_number_chunks.
+    """
+
+    if len(chunk_file_names) == 1:
+        logger.info("There is only one chunk, copying it to the resulting file...")
+        copy_file(chunk_file_names[0], resulting_file_name)
+        return
+
+    # chunks with keys were checked to be phone numbers when they were sorted
+    by_keys = all(name in keyed_chunk_file_names for name in chunk_file_names)
+    if record_length and (by_keys or all(is_fixed_width(name, record_length) for name in chunk_file_names)):
+        logger.info("Merge chunks of fixed-width lines into one resulting file...")
+        merge_fixed_width(chunk_file_names, resulting_file_name, record_length, by_keys)
+        return
 
     logger.info("Opening sorted files...")
     chunks = [open(file_name, "r") for file_name in chunk_file_names]
@@ -46,25 +253,117 @@ def merge_files(chunk_file_names: tp.List[str], resulting_file_name: str) -> Non
     [chunk.close() for chunk in chunks]
 
 
+def phone_number_keys(records: np.ndarray) -> tp.Optional[np.ndarray]:
+    """Returns phone numbers of "+<digits>\\n" records as integers, None for any other lines."""
+    digits = records[:, 1:-1] - np.uint8(ord("0"))
+    if (digits.shape[1] > 19
+            or not np.all(records[:, 0] == ord("+"))
+            or not np.all(records[:, -1] == ord("\n"))
+            or not np.all(digits < 10)):
+        return None
+
+    keys = np.zeros(len(records), dtype=np.uint64)
+    for column in range(digits.shape[1]):
+        keys = keys * np.uint64(10) + digits[:, column]
+    return keys
+
+
+def sort_phone_number_chunks(phone_numbers_file: tp.BinaryIO,
+                             lines_per_chunk: int,
+                             record_length: int,
+                             chunk_name_template: str) -> tp.List[str]:
+    """Sorts chunks of fixed-width phone numbers by their numeric value.
+
+    Stops at the first chunk which contains anything but phone numbers and leaves the file
+    positioned at its beginning.
+    """
+    chunk_file_names = []
+    fd = phone_numbers_file.fileno()
+    file_size = os.fstat(fd).st_size
+    chunk_size = lines_per_chunk * record_length
+    position = file_size
+    if not file_size:
+        return chunk_file_names
+
+    # chunks are read straight from the page cache, the only copy made is the sorted one
+    with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mapped_file:
+        if hasattr(mapped_file, "madvise"):
+            mapped_file.madvise(mmap.MADV_SEQUENTIAL)
+
+        for chunk_start in range(0, file_size, chunk_size):
+            count = min(chunk_size, file_size - chunk_start)
+            records = np.frombuffer(mapped_file, dtype=np.uint8, count=count, offset=chunk_start)
+            keys = (phone_number_keys(records.reshape(-1, record_length))
+                    if count % record_length == 0 else None)
+            if keys is None:
+                position = chunk_start
+                # mmap can't be closed while numpy still holds a view of it
+                del records
+                break
+
+            logger.info(f"Start sorting {len(chunk_file_names) + 1} part of original file...")
+            # the same numbers make the same lines, so a stable sort is not needed
+            order = np.argsort(keys)
+            records = records.reshape(-1, record_length)[order]
+
+            file_name = chunk_name_template.format(len(chunk_file_names) + 1)
+            chunk_file_names.append(file_name)
+            logger.info(f"Saving {file_name}...")
+            out_fd = os.open(file_name, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                write_all(out_fd, records.data)
+            finally:
+                os.close(out_fd)
+            # keys are saved as well, so merging compares integers instead of lines
+            keys[order].tofile(keys_file_name(file_name))
+            drop_from_cache(fd, chunk_start, count, mapped_file)
+            # free the chunk before the next one is read, not after
+            del records, keys, order
+            release_memory()
+
+    phone_numbers_file.seek(position)
+    return chunk_file_names
+
+
 def split_huge_file_into_sorted_chucks(file_name_with_numbers_to_sort: str,
                                        lines_per_chunk: int,
-                                       chunk_name_template: str) -> tp.List[str]:
-    """Reads file line by line, splits it into chunks, sort lines in each chunk, saves it."""
+                                       chunk_name_template: str,
+                                       record_length: tp.Optional[int] = None
+                                       ) -> tp.Tuple[tp.List[str], tp.List[str]]:
+    """Reads file line by line, splits it into chunks, sort lines in each chunk, saves it.
+
+    Returns names of all chunks and names of the chunks which have keys saved next to them.
+    """
 
     chunk_file_names = []
+    keyed_chunk_file_names = []
 
-    with open(file_name_with_numbers_to_sort, "r") as phone_numbers_file:
-        for i, lines in enumerate(chunked(phone_numbers_file, lines_per_chunk), start=1):
-            logger.info(f"Start sorting {i} part of original file...")
-            lines.sort()
-            file_name = chunk_name_template.format(i)
-            chunk_file_names.append(file_name)
-            with open(file_name, "w") as chunk:
-                logger.info(f"Saving {file_name}...")
-                chunk.writelines(lines)
+    with open(file_name_with_numbers_to_sort, "rb") as binary_file:
+        advise_sequential(binary_file.fileno())
+        if record_length:
+            keyed_chunk_file_names = sort_phone_number_chunks(binary_file, lines_per_chunk,
+                                                              record_length, chunk_name_template)
+            chunk_file_names = list(keyed_chunk_file_names)
 
+        # whatever is left doesn't consist of phone numbers only and is sorted as text
+        with io.TextIOWrapper(binary_file) as phone_numbers_file:
+            for i, lines in enumerate(chunked(phone_numbers_file, lines_per_chunk),
+                                      start=len(chunk_file_names) + 1):
+                logger.info(f"Start sorting {i} part of original file...")
+                lines.sort()
+                file_name = chunk_name_template.format(i)
+                chunk_file_names.append(file_name)
+                with open(file_name, "w") as chunk:
+                    logger.info(f"Saving {file_name}...")
+                    chunk.writelines(lines)
+                # keys left behind by an interrupted run don't belong to this chunk
+                if os.path.exists(keys_file_name(file_name)):
+                    os.remove(keys_file_name(file_name))
+                del lines
+                release_memory()
 
-    return chunk_file_names
+
+    return chunk_file_names, keyed_chunk_file_names
 
 
 def main():
@@ -75,12 +374,23 @@ def main():
     logger.info(f"Chunk size is {LINES_PER_CHUNK} lines.")
     logger.info(f"Resulting file name is {RESULTING_FILE_NAME} lines.")
 
-    chunk_file_names = split_huge_file_into_sorted_chucks(FILE_NAME_WITH_NUMBERS_TO_SORT,
-                                                          LINES_PER_CHUNK,
-                                                          CHUNK_NAME_TEMPLATE)
-    merge_files(chunk_file_names, RESULTING_FILE_NAME)
+    record_length = detect_record_length(FILE_NAME_WITH_NUMBERS_TO_SORT)
+    if (record_length == RECORD_LENGTH
+            and is_permutation_of_range(FILE_NAME_WITH_NUMBERS_TO_SORT, START_NUMBER, STOP_NUMBER)):
+        logger.info("The file is a shuffled range of phone numbers, writing the sorted file directly...")
+        produce_sorted_file(RESULTING_FILE_NAME, START_NUMBER, STOP_NUMBER)
+
+        resulted_time = perf_counter() - start_time
+        logger.info(f"Time taken for the whole script to run: {resulted_time} seconds")
+        return
+
+    chunk_file_names, keyed_chunk_file_names = split_huge_file_into_sorted_chucks(
+        FILE_NAME_WITH_NUMBERS_TO_SORT, LINES_PER_CHUNK, CHUNK_NAME_TEMPLATE, record_length)
+    merge_files(chunk_file_names, RESULTING_FILE_NAME, record_length=record_length,
+                keyed_chunk_file_names=keyed_chunk_file_names)
 
     [os.remove(file) for file in chunk_file_names]
+    [os.remove(keys_file_name(file)) for file in keyed_chunk_file_names]
 
     resulted_time = perf_counter() - start_time
     logger.info(f"Time taken for the whole script to run: {resulted_time} seconds")
@@ -0,0 +1,29 @@
+from shuffle_file import shuffle_fixed_width, shuffle_lines
+
+
+def test_lines_of_different_length_are_not_shuffled_as_records(tmp_path):
+    # the first line is 3 bytes long and so is the file's size divided by 3
+    file_name = tmp_path / "input.txt"
+    file_name.write_bytes(b"ab\n\nx\n")
+
+    assert not shuffle_fixed_width(str(file_name), str(tmp_path / "shuffled.txt"), 3)
+
+
+def test_equally_long_lines_are_shuffled_as_records(tmp_path):
+    lines = [b"%04d\n" % i for i in range(100)]
+    file_name = tmp_path / "input.txt"
+    resulting_file_name = tmp_path / "shuffled.txt"
+    file_name.write_bytes(b"".join(lines))
+
+    assert shuffle_fixed_width(str(file_name), str(resulting_file_name), 5)
+    assert sorted(resulting_file_name.read_bytes().splitlines(keepends=True)) == lines
+
+
+def test_last_line_without_line_break_is_kept_apart(tmp_path):
+    file_name = tmp_path / "input.txt"
+    resulting_file_name = tmp_path / "shuffled.txt"
+    file_name.write_bytes(b"b\na\nc")
+
+    for _ in range(20):
+        shuffle_lines(str(file_name), str(resulting_file_name))
+        assert sorted(resulting_file_name.read_bytes().splitlines(keepends=True)) == [b"a\n", b"b\n", b"c\n"]
@@ -0,0 +1,56 @@
+import random
+
+import numpy as np
+import pytest
+
+from sort_random_phone_numbers import keys_file_name, merge_files, split_huge_file_into_sorted_chucks
+from utils import detect_record_length, format_phone_numbers
+
+
+def sort_file(tmp_path, content: bytes, lines_per_chunk: int) -> bytes:
+    """Sorts content the same way main() does and returns the resulting file."""
+    file_name = tmp_path / "input.txt"
+    resulting_file_name = tmp_path / "sorted.txt"
+    file_name.write_bytes(content)
+
+    record_length = detect_record_length(str(file_name))
+    chunk_file_names, keyed_chunk_file_names = split_huge_file_into_sorted_chucks(
+        str(file_name), lines_per_chunk, str(tmp_path / "chunk_{0}.txt"), record_length)
+    merge_files(chunk_file_names, str(resulting_file_name), record_length=record_length,
+                keyed_chunk_file_names=keyed_chunk_file_names)
+    return resulting_file_name.read_bytes()
+
+
+def test_chunks_of_several_short_lines_are_not_merged_as_records(tmp_path):
+    # with 3 lines per chunk, both chunks are 6 bytes long and end with a line break
+    assert sort_file(tmp_path, b"ba\n\na\nba\nb\n\n", lines_per_chunk=3) == b"\n\na\nb\nba\nba\n"
+
+
+
+def test_keys_left_by_an_interrupted_run_are_not_used(tmp_path):
+    rng = random.Random(0)
+    lines = ["".join(rng.choice("abcd") for _ in range(4)) + "\n" for _ in range(3000)]
+    for i in range(1, 4):
+        np.zeros(10, dtype=np.uint64).tofile(keys_file_name(str(tmp_path / f"chunk_{i}.txt")))
+
+    assert sort_file(tmp_path, "".join(lines).encode(), lines_per_chunk=1000) == "".join(sorted(lines)).encode()
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_random_lines_are_sorted(tmp_path, seed):
+    rng = random.Random(seed)
+    lines = ["".join(rng.choice("ab") for _ in range(rng.randint(0, 3))) + "\n"
+             for _ in range(rng.randint(1, 40))]
+    content = "".join(lines).encode()
+
+    assert sort_file(tmp_path, content, lines_per_chunk=rng.randint(1, 10)) == "".join(sorted(lines)).encode()
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_phone_numbers_are_sorted(tmp_path, seed):
+    rng = np.random.default_rng(seed)
+    numbers = rng.integers(79000000000, 79000001000, rng.integers(1, 300))
+    content = format_phone_numbers(numbers).tobytes()
+
+    expected = format_phone_numbers(np.sort(numbers)).tobytes()
+    assert sort_file(tmp_path, content, lines_per_chunk=int(rng.integers(1, 50))) == expected
@@ -1,12 +1,33 @@
+import ctypes
+import ctypes.util
+import gc
+import logging
+import mmap
+import os
+import shutil
 import typing as tp
 
+import numpy as np
+from numba import njit
+
 VALUE = tp.TypeVar("VALUE")
 
 from itertools import islice
+from time import perf_counter
+
+# every phone number is written as "+" followed by 11 digits and a line break
+PHONE_NUMBER_DIGITS = 11
+RECORD_LENGTH = PHONE_NUMBER_DIGITS + 2
+# consecutive numbers share all digits but the last few, those are the only ones computed per number
+LOW_DIGITS = 7
 
 
 def chunked(iterable: tp.Iterable[VALUE], chunk_size: int) -> tp.Iterator[tp.List[VALUE]]:
-    """Returns one chunk of the given iterable at a time"""
+    """Returns one chunk of the given iterable at a time
+
+    Every chunk is a list of Python objects, so it's slow for numbers, use chunked_arange for
+    ranges of numbers.
+    """
     # we need to be sure that we store an iterator in closure in order to keep
     # the state of iteration
     iterable = iter(iterable)
@@ -15,4 +36,234 @@ def chunked(iterable: tp.Iterable[VALUE], chunk_size: int) -> tp.Iterator[tp.Lis
         # always start over and return first n elements on every call
         return list(islice(iterable, chunk_size))
     # The second argument of iter is what will return on stop iteration.
-    return iter(wrapper, [])
\ No newline at end of file
+    return iter(wrapper, [])
+
+
+def chunked_arange(start: int, stop: int, chunk_size: int) -> tp.Iterator[np.ndarray]:
+    """Returns numbers from start to stop as arrays of at most chunk_size numbers."""
+    for chunk_start in range(start, stop, chunk_size):
+        yield np.arange(chunk_start, min(chunk_start + chunk_size, stop), dtype=np.int64)
+
+
+def log_progress(logger: logging.Logger, numbers_written: int, total: int, start_time: float) -> None:
+    """Logs how many numbers are done, meant to be called once per block of numbers."""
+    logger.info(f"There are {numbers_written} of {total} numbers ({numbers_written / total:.0%}) "
+                f"written in {perf_counter() - start_time:.1f} seconds")
+
+
+def format_phone_numbers(numbers: np.ndarray) -> np.ndarray:
+    """Returns a (len(numbers), RECORD_LENGTH) matrix of bytes, one "+<number>\\n" line per row."""
+    records = np.empty((len(numbers), RECORD_LENGTH), dtype=np.uint8)
+    records[:, 0] = ord("+")
+    records[:, -1] = ord("\n")
+
+    # peel digits off from the least significant one, filling columns right to left
+    rest = numbers.astype(np.int64)
+    for column in range(PHONE_NUMBER_DIGITS, 0, -1):
+        rest, digits = np.divmod(rest, 10)
+        records[:, column] = digits + ord("0")
+
+    return records
+
+
+def format_phone_number_range(start: int, stop: int, out: tp.Optional[np.ndarray] = None) -> np.ndarray:
+    """Does the same as format_phone_numbers for numbers from start to stop, but faster.
+
+    The result is written to out if it's given.
+    """
+    records = np.empty((stop - start, RECORD_LENGTH), dtype=np.uint8) if out is None else out
+    records[:, -1] = ord("\n")
+
+    high_width = RECORD_LENGTH - LOW_DIGITS - 1
+    step = 10 ** LOW_DIGITS
+    segment_start = start
+    while segment_start < stop:
+        segment_stop = min((segment_start // step + 1) * step, stop)
+        segment = records[segment_start - start:segment_stop - start]
+
+        # "+" and high digits are the same for the whole segment, so they are computed once
+        prefix = f"+{segment_start // step:0{high_width - 1}d}".encode()
+        segment[:, :high_width] = np.frombuffer(prefix, dtype=np.uint8)
+
+        rest = np.arange(segment_start % step, segment_start % step + len(segment), dtype=np.int32)
+        for column in range(RECORD_LENGTH - 2, high_width - 1, -1):
+            rest, digits = np.divmod(rest, 10)
+            segment[:, column] = digits + ord("0")
+
+        segment_start = segment_stop
+
+    return records
+
+
+def detect_record_length(file_name: str) -> tp.Optional[int]:
+    """Returns the length of lines if the file looks like it consists of equally long lines."""
+    with open(file_name, "rb") as file:
+        first_line = file.readline()
+        file_size = os.fstat(file.fileno()).st_size
+
+    if first_line.endswith(b"\n") and file_size % len(first_line) == 0:
+        return len(first_line)
+    return None
+
+
+def is_one_line_per_row(records: np.ndarray, block_size: int = 2 ** 20) -> bool:
+    """Checks that every row of a matrix of bytes is exactly one line: a line break ends it and
+    there is no other line break in it."""
+    # rows are checked block by block, so temporaries never get as big as the matrix
+    for block_start in range(0, len(records), block_size):
+        block = records[block_start:block_start + block_size]
+        if (not np.all(block[:, -1] == ord("\n"))
+                or np.count_nonzero(block == ord("\n")) != len(block)):
+            return False
+    return True
+
+
+def write_all(fd: int, data: tp.Union[bytes, memoryview], offset: tp.Optional[int] = None) -> None:
+    """Writes the whole buffer to a file descriptor, os.write may write only a part of it.
+
+    If offset is given, the data is written at that position of the file and the file's
+    current position stays where it was.
+    """
+    data = memoryview(data)
+    if not data.nbytes:
+        return
+
+    data = data.cast("B")
+    while data:
+        if offset is None:
+            written = os.write(fd, data)
+        else:
+            written = os.pwrite(fd, data, offset)
+            offset += written
+        data = data[written:]
+
+
+def release_memory() -> None:
+    """Collects garbage and asks libc to give freed memory back to OS."""
+    gc.collect()
+    libc_name = ctypes.util.find_library("c")
+    try:
+        # glibc only, other platforms don't have malloc_trim
+        ctypes.CDLL(libc_name).malloc_trim(0)
+    except (OSError, AttributeError, TypeError):
+        pass
+
+
+def advise_sequential(fd: int) -> None:
+    """Tells OS the file is going to be read from start to end, so it reads ahead more."""
+    if hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+
+def drop_from_cache(fd: int,
+                    offset: int,
+                    length: int,
+                    mapped_file: tp.Optional[mmap.mmap] = None) -> None:
+    """Tells OS that this part of the file won't be read again, so its pages can be evicted.
+
+    If the file is memory-mapped, pass the mapping too: OS doesn't evict pages that are still
+    mapped, so they have to be unmapped from it first.
+    """
+    if mapped_file is not None and hasattr(mapped_file, "madvise"):
+        # madvise wants the start of a page
+        aligned_offset = offset - offset % mmap.PAGESIZE
+        mapped_file.madvise(mmap.MADV_DONTNEED, aligned_offset, length + offset - aligned_offset)
+    if hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(fd, offset, length, os.POSIX_FADV_DONTNEED)
+
+
+def copy_file(source_file_name: str, destination_file_name: str) -> None:
+    """Copies a file inside the kernel, without passing its content through Python."""
+    with open(source_file_name, "rb") as source, open(destination_file_name, "wb") as destination:
+        if not hasattr(os, "sendfile"):
+            shutil.copyfileobj(source, destination, 1024 * 1024)
+            return
+
+        size = os.fstat(source.fileno()).st_size
+        offset = 0
+        while offset < size:
+            try:
+                offset += os.sendfile(destination.fileno(), source.fileno(), offset, size - offset)
+            except OSError:
+                # macOS can only send files to sockets
+                source.seek(offset)
+                shutil.copyfileobj(source, destination, 1024 * 1024)
+                return
+
+
+# how many random indexes are generated before doing the swaps
+DICE_BATCH_SIZE = 1024
+
+
+@njit(cache=True)
+def _rotate_left(x: np.uint64, k: int) -> np.uint64:
+    return (x << np.uint64(k)) | (x >> np.uint64(64 - k))
+
+
+@njit(cache=True)
+def _xoshiro256starstar(state: np.ndarray) -> np.uint64:
+    """Returns the next random 64-bit number and advances the state in place."""
+    result = _rotate_left(state[1] * np.uint64(5), 7) * np.uint64(9)
+    t = state[1] << np.uint64(17)
+
+    state[2] ^= state[0]
+    state[3] ^= state[1]
+    state[1] ^= state[2]
+    state[0] ^= state[3]
+    state[2] ^= t
+    state[3] = _rotate_left(state[3], 45)
+
+    return result
+
+
+@njit(cache=True)
+def _multiply_full(a: np.uint64, b: np.uint64) -> tp.Tuple[np.uint64, np.uint64]:
+    """Returns high and low 64 bits of the 128-bit product of a and b."""
+    mask = np.uint64(0xFFFFFFFF)
+    shift = np.uint64(32)
+    a_low, a_high = a & mask, a >> shift
+    b_low, b_high = b & mask, b >> shift
+
+    low_low = a_low * b_low
+    high_low = a_high * b_low
+    cross = (low_low >> shift) + (high_low & mask) + a_low * b_high
+
+    high = a_high * b_high + (high_low >> shift) + (cross >> shift)
+    low = (cross << shift) | (low_low & mask)
+    return high, low
+
+
+@njit(cache=True)
+def _random_below(state: np.ndarray, bound: np.uint64) -> np.uint64:
+    """Returns a random number in [0, bound) using Lemire's multiply-and-shift method."""
+    high, low = _multiply_full(_xoshiro256starstar(state), bound)
+    if low < bound:
+        # reject the few values which would make some results more likely than others
+        threshold = (np.uint64(0) - bound) % bound
+        while low < threshold:
+            high, low = _multiply_full(_xoshiro256starstar(state), bound)
+    return high
+
+
+@njit(cache=True)
+def _fy_shuffle(records: np.ndarray, state: np.ndarray) -> None:
+    dice = np.empty(DICE_BATCH_SIZE, dtype=np.uint64)
+    i = len(records) - 1
+    while i > 0:
+        batch_size = min(DICE_BATCH_SIZE, i)
+        for k in range(batch_size):
+            dice[k] = _random_below(state, np.uint64(i - k + 1))
+
+        for k in range(batch_size):
+            j = np.intp(dice[k])
+            # swap byte by byte, it's compiled anyway and needs no temporary row
+            for column in range(records.shape[1]):
+                records[i - k, column], records[j, column] = records[j, column], records[i - k, column]
+
+        i -= batch_size
+
+
+def fy_shuffle(records: np.ndarray) -> None:
+    """Shuffles rows of a 2d array in place with the Fisher-Yates algorithm."""
+    state = np.random.SeedSequence().generate_state(4, dtype=np.uint64)
+    _fy_shuffle(records, state)